@@ -5,10 +5,19 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from io import BytesIO
-from wordcloud import WordCloud
 import re
+import os
+import hmac
+import hashlib
+import time
+import traceback
+import logging
 from collections import Counter
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 import gspread
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from pandas.tseries.api import guess_datetime_format
 
 # ============================================
 # CONFIGURACIÓN DE USUARIOS Y ACCESOS
@@ -22,10 +31,61 @@ USUARIOS = {
     "master": {"password": "idemefa", "filtro": None}  # None significa acceso completo
 }
 
+# Hash SHA-256 de cada contraseña, calculado una sola vez al cargar el módulo
+USUARIOS_HASH = {
+    usuario: hashlib.sha256(datos["password"].encode()).digest()
+    for usuario, datos in USUARIOS.items()
+}
+
+# Estilos CSS personalizados del panel
+ESTILOS_CSS = """
+<style>
+    .main {
+        padding: 2rem;
+    }
+    .sidebar .sidebar-content {
+        padding: 1rem;
+    }
+    .kpi-card {
+        background: white;
+        border-radius: 5px;
+        padding: 1rem;
+        margin-bottom: 1rem;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        border-left: 4px solid #4CAF50;
+    }
+    .kpi-title {
+        font-size: 0.9rem;
+        color: #555;
+        margin-bottom: 0.5rem;
+    }
+    .kpi-value {
+        font-size: 1.5rem;
+        font-weight: bold;
+        color: #333;
+    }
+    .kpi-subtext {
+        font-size: 0.8rem;
+        color: #777;
+        margin-top: 0.5rem;
+    }
+    .tab-content {
+        padding-top: 1rem;
+    }
+</style>
+"""
+
 # ============================================
 # FUNCIÓN DE AUTENTICACIÓN
 # ============================================
 
+def verificar_credenciales(usuario, password):
+    """Compara el hash de la contraseña en tiempo constante"""
+    hash_guardado = USUARIOS_HASH.get(usuario)
+    if hash_guardado is None:
+        return False
+    return hmac.compare_digest(hash_guardado, hashlib.sha256(password.encode()).digest())
+
 def autenticar():
     st.sidebar.title("🔐 Acceso al Sistema")
     
@@ -48,7 +108,7 @@ def autenticar():
             enviar = st.form_submit_button("Ingresar")
             
             if enviar:
-                if usuario in USUARIOS and USUARIOS[usuario]["password"] == password:
+                if verificar_credenciales(usuario, password):
                     st.session_state.autenticado = True
                     st.session_state.usuario_actual = usuario
                     st.session_state.filtro_vendedor = USUARIOS[usuario]["filtro"]
@@ -66,42 +126,7 @@ st.set_page_config(
 )
 
 # Estilos CSS personalizados
-st.markdown("""
-<style>
-    .main {
-        padding: 2rem;
-    }
-    .sidebar .sidebar-content {
-        padding: 1rem;
-    }
-    .kpi-card {
-        background: white;
-        border-radius: 5px;
-        padding: 1rem;
-        margin-bottom: 1rem;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        border-left: 4px solid #4CAF50;
-    }
-    .kpi-title {
-        font-size: 0.9rem;
-        color: #555;
-        margin-bottom: 0.5rem;
-    }
-    .kpi-value {
-        font-size: 1.5rem;
-        font-weight: bold;
-        color: #333;
-    }
-    .kpi-subtext {
-        font-size: 0.8rem;
-        color: #777;
-        margin-top: 0.5rem;
-    }
-    .tab-content {
-        padding-top: 1rem;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(ESTILOS_CSS, unsafe_allow_html=True)
 
 # Mapeo de meses inglés a español
 MESES_ES = {
@@ -122,10 +147,183 @@ MESES_ES = {
 MESES_ORDEN = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
                'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
 
+# Tipo categórico ordenado para la columna MES
+MESES_DTYPE = pd.CategoricalDtype(categories=MESES_ORDEN, ordered=True)
+
+# Días de la semana (lunes = 0, como dt.weekday) y su tipo categórico para DIA_SEM
+DIAS_SEMANA = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DIAS_DTYPE = pd.CategoricalDtype(categories=DIAS_SEMANA, ordered=True)
+
+# Todo lo que no sea dígito o punto en montos escritos como texto ("$1,234.50")
+CARACTERES_NO_NUMERICOS = re.compile(r'[^\d.]')
+
+# Muletillas contadas en las transcripciones de llamadas
+PALABRAS_RELLENO = re.compile(r"\b(?:eh|este|o sea|mmm|ah)\b", re.IGNORECASE)
+
+# Nombres de columna con que se muestra la tabla de cumplimiento
+COLUMNAS_CUMPLIMIENTO = {
+    'MONTO_real': 'MONTO REAL',
+    'MONTO_meta': 'MONTO META',
+    'Cantidad': 'CANTIDAD REAL',
+    'CANTIDAD': 'CANTIDAD META',
+    'VDE': 'VENDEDOR',
+    'Documento': 'FACTURAS',
+    'CODIGO': 'CLIENTES',
+    '% Cumplimiento Ventas': '% CUMPL. VENTAS',
+    '% Cumplimiento Cajas': '% CUMPL. CANTIDAD'
+}
+
+# Formato de las tablas de cumplimiento por categoría y subcategoría (se aplica en el navegador)
+FORMATO_CUMPLIMIENTO_CATEGORIA = {
+    'MONTO_Real': st.column_config.NumberColumn('MONTO_Real', format='dollar'),
+    'MONTO_Presupuesto': st.column_config.NumberColumn('MONTO_Presupuesto', format='dollar'),
+    '% Cumplimiento': st.column_config.ProgressColumn('% Cumplimiento', format='%.1f%%', min_value=0, max_value=150)
+}
+
+# Formato de la tabla de productos más vendidos por vendedor
+FORMATO_TOP_PRODUCTOS = {
+    'Ventas': st.column_config.NumberColumn('Ventas', format='dollar'),
+    'Cantidad': st.column_config.NumberColumn('Cantidad', format='localized')
+}
+
+# Máximo de puntos que se envían al navegador en gráficos de línea (se reduce con LTTB)
+MAX_PUNTOS_GRAFICO = 2000
+
+# Medidas que se suman en los KPIs: reducir_tipos no las toca para que los totales sean exactos
+COLUMNAS_MEDIDA = ['Total', 'MONTO', 'Cantidad', 'CANTIDAD']
+
+# Carpeta de las copias parquet de las hojas descargadas (privada de la app, junto a vde.py)
+DIRECTORIO_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_vde")
+
+# Registro de avisos internos (fallos de la copia en disco) en el log del servidor
+LOGGER = logging.getLogger("vde")
+
+# Columnas de ventas que usa el módulo de Consulta (detalle, gráficos y exportación)
+COLUMNAS_CONSULTA = ['CODIGO', 'CLIENTE', 'VDE', 'Fecha', 'Documento', 'COD_PROD', 'Descripcion', 'Cantidad', 'MONTO']
+
 # ============================================
 # FUNCIONES DE CARGA DE DATOS
 # ============================================
 
+def directorio_cache_disco():
+    """Carpeta privada de la app (solo su usuario, 0700) para las copias parquet de las hojas"""
+    # Junto a la app y no en el temporal compartido: los datos quedan detrás del login,
+    # y otros usuarios de la máquina no pueden leer las copias ni dejar archivos falsos en su lugar
+    os.makedirs(DIRECTORIO_CACHE, mode=0o700, exist_ok=True)
+    os.chmod(DIRECTORIO_CACHE, 0o700)  # Por si la carpeta ya existía con otros permisos
+    return DIRECTORIO_CACHE
+
+def ruta_cache_disco(nombre):
+    """Ruta del archivo parquet que guarda una copia local de la hoja"""
+    return os.path.join(directorio_cache_disco(), f"{nombre}.parquet")
+
+def leer_cache_disco(nombre, ttl=3600):
+    """Lee la copia parquet si existe y no ha vencido; None en caso contrario"""
+    # Esta vigencia corre aparte de la de st.cache_data: una copia de casi una hora puede
+    # quedar otra hora en memoria, así que los datos pueden tener hasta ~2 horas
+    try:
+        ruta = ruta_cache_disco(nombre)
+        if os.path.exists(ruta) and time.time() - os.path.getmtime(ruta) < ttl:
+            df = pd.read_parquet(ruta)
+            # pyarrow devuelve las categorías numéricas (p. ej. códigos) como int64 y las fechas
+            # en segundos como ms (parquet no tiene esa resolución): se restauran los tipos originales
+            for col, categorias in df.attrs.pop('categorias', {}).items():
+                df[col] = pd.Categorical(df[col], categories=categorias)
+            for col, tipo in df.attrs.pop('fechas', {}).items():
+                df[col] = df[col].astype(tipo)
+            return df
+    except Exception as e:
+        LOGGER.warning("No se pudo leer la copia en disco de '%s': %s", nombre, e)
+    return None
+
+def guardar_cache_disco(df, nombre):
+    """Guarda la copia parquet de la hoja ya procesada y devuelve el mismo DataFrame"""
+    try:
+        # Las categorías que no son texto y el tipo de cada fecha se anotan en los metadatos
+        # para restaurarlos al leer
+        copia = df.copy(deep=False)
+        copia.attrs = {
+            'categorias': {
+                col: df[col].cat.categories.tolist()
+                for col in df.columns
+                if isinstance(df[col].dtype, pd.CategoricalDtype) and not pd.api.types.is_string_dtype(df[col].cat.categories)
+            },
+            'fechas': {col: str(df[col].dtype) for col in df.columns if pd.api.types.is_datetime64_dtype(df[col])}
+        }
+        copia.to_parquet(ruta_cache_disco(nombre))
+    except Exception as e:
+        # La copia en disco es opcional; si falla se vuelve a descargar la próxima vez
+        LOGGER.warning("No se pudo guardar la copia en disco de '%s': %s", nombre, e)
+    return df
+
+def limpiar_cache_disco():
+    """Elimina las copias parquet para forzar la descarga desde Google Drive"""
+    for nombre in ['ventas', 'presupuesto', 'clientes', 'llamadas']:
+        try:
+            ruta = ruta_cache_disco(nombre)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        except OSError as e:
+            LOGGER.warning("No se pudo eliminar la copia en disco de '%s': %s", nombre, e)
+
+def leer_csv(url):
+    """Lee la hoja exportada con el lector multihilo de pyarrow (motor C si no está instalado)"""
+    try:
+        return pd.read_csv(url, engine='pyarrow')
+    except ImportError:
+        return pd.read_csv(url)
+
+def convertir_fechas(serie, formato=None):
+    """Convierte a datetime con formato explícito (inferido del primer valor si no se indica)"""
+    if formato is None:
+        muestra = serie.dropna()
+        if not muestra.empty:
+            formato = guess_datetime_format(str(muestra.iloc[0]))
+    return pd.to_datetime(serie, format=formato, errors='coerce', cache=True)
+
+def limpiar_monto(serie):
+    """Convierte montos a float; solo los valores con símbolos pasan por la expresión regular"""
+    # Sin signo en ambos caminos: la expresión regular descarta el '-', así que '-500' y '-$500' dan 500
+    montos = pd.to_numeric(serie, errors='coerce').abs()
+    pendientes = montos.isna() & serie.notna()
+    if pendientes.any():
+        montos = montos.astype(float)
+        montos.loc[pendientes] = pd.to_numeric(
+            serie[pendientes].astype(str).str.replace(CARACTERES_NO_NUMERICOS, '', regex=True),
+            errors='coerce'
+        )
+    return montos.fillna(0.0).astype(float)
+
+def mes_en_espanol(fechas):
+    """Mes en español como categoría ordenada a partir del número de mes (NaT queda vacío)"""
+    codigos = fechas.dt.month.fillna(0).astype(int).to_numpy() - 1
+    return pd.Series(pd.Categorical.from_codes(codigos, dtype=MESES_DTYPE), index=fechas.index)
+
+def clasificar_calidad(puntajes):
+    """Clasificación de llamadas según el puntaje de calidad (vectorizada con np.select)"""
+    p = puntajes.to_numpy()
+    etiquetas = ["🏆 Ejemplar", "✅ Satisfactorio", "⚠️ Necesita Mejora", "🔴 Crítico"]
+    clasificacion = np.select([p >= 85, p >= 70, p >= 50], etiquetas[:3], default=etiquetas[3])
+    return pd.Series(pd.Categorical(clasificacion, categories=etiquetas), index=puntajes.index)
+
+def reducir_tipos(df, umbral_categoria=0.5):
+    """Reduce memoria: enteros al tipo más pequeño, texto repetitivo a categoría y el resto a string de Arrow"""
+    # Los float quedan en float64: en float32 las sumas se acumulan y devuelven en float32,
+    # y se desvían aunque cada valor por separado sea exacto
+    conversiones = {}
+    for col in df.columns:
+        serie = df[col]
+        if col in COLUMNAS_MEDIDA or pd.api.types.is_bool_dtype(serie):
+            continue
+        if pd.api.types.is_integer_dtype(serie):
+            conversiones[col] = pd.to_numeric(serie, downcast='integer')
+        elif pd.api.types.is_string_dtype(serie):
+            if len(serie) and serie.nunique() / len(serie) < umbral_categoria:
+                conversiones[col] = serie.astype('category')
+            else:
+                conversiones[col] = serie.astype('string[pyarrow]')  # Texto en búfer UTF-8 contiguo, sin un objeto Python por fila
+    return df.assign(**conversiones)
+
 @st.cache_data(ttl=3600)
 def load_sales_data():
     """Carga datos de ventas desde la hoja DB_VNT"""
@@ -133,7 +331,11 @@ def load_sales_data():
     url = "https://docs.google.com/spreadsheets/d/1WWynEjZGN8zxlIOUab1CjjMSgXhDBd4y/export?format=csv&gid=674013502"
 
     try:
-        df = pd.read_csv(url)
+        df = leer_cache_disco('ventas')
+        if df is not None:
+            return df
+
+        df = leer_csv(url)
 
         # Verificación de columnas esenciales
         required_columns = ['CODIGO', 'CLIENTE', 'Documento', 'Fecha', 'Total', 'VDE']
@@ -142,17 +344,24 @@ def load_sales_data():
             return None
 
         # Limpieza y transformación
-        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+        df['Fecha'] = convertir_fechas(df['Fecha'])
         df['MONTO'] = pd.to_numeric(df['Total'], errors='coerce')
-        df['ANO'] = df['Fecha'].dt.year
-        df['MES'] = df['Fecha'].dt.strftime('%B').map(MESES_ES)
-        df['DIA_SEM'] = df['Fecha'].dt.day_name()
-        df['SEM'] = df['Fecha'].dt.isocalendar().week
-
-        # Orden de meses en español
-        df['MES_ORDEN'] = pd.Categorical(df['MES'], categories=MESES_ORDEN, ordered=True)
-
-        return df.dropna(subset=['Fecha', 'MONTO'])
+        df = df.dropna(subset=['Fecha', 'MONTO'])
+
+        # Año, mes, día y semana en una sola pasada sobre el arreglo datetime64 por días
+        dias = df['Fecha'].to_numpy().astype('datetime64[D]')
+        dia_semana = (dias.astype(np.int64) + 3) % 7  # 1970-01-01 fue jueves; lunes = 0
+        jueves = dias - dia_semana + 3  # Semana ISO: la semana del año en que cae su jueves
+        df['ANO'] = (dias.astype('datetime64[Y]').astype(np.int64) + 1970).astype(np.int16)
+        df['MES'] = pd.Categorical.from_codes(dias.astype('datetime64[M]').astype(np.int64) % 12, dtype=MESES_DTYPE)
+        df['DIA_SEM'] = pd.Categorical.from_codes(dia_semana, dtype=DIAS_DTYPE)
+        df['SEM'] = ((jueves - jueves.astype('datetime64[Y]')).astype(np.int64) // 7 + 1).astype(np.int16)
+        # Claves de agrupación y filtro como categorías: groupby e isin trabajan sobre códigos enteros
+        for col in ['VDE', 'CLIENTE', 'CATEGORIA', 'SUBCATEGORIA', 'COD_PROD']:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+
+        return guardar_cache_disco(reducir_tipos(df), 'ventas')
     except Exception as e:
         st.error(f"Error al cargar datos de ventas: {str(e)}")
         return None
@@ -163,21 +372,19 @@ def load_budget_data():
     url = "https://docs.google.com/spreadsheets/d/1WWynEjZGN8zxlIOUab1CjjMSgXhDBd4y/export?format=csv&gid=1523879888"
 
     try:
-        df = pd.read_csv(url)
+        df = leer_cache_disco('presupuesto')
+        if df is not None:
+            return df
+
+        df = leer_csv(url)
 
         # Verificación de columnas
         if 'MONTO' not in df.columns:
             st.error("La columna 'MONTO' no existe en DB_PPTO")
             return None
 
-        # Limpieza de valores numéricos
-        df['MONTO'] = (
-            df['MONTO']
-            .astype(str)
-            .str.replace(r'[^\d.]', '', regex=True)  # Elimina todo excepto números y punto
-            .replace('', '0')
-            .astype(float)
-        )
+        # Limpieza de valores numéricos (vacíos o inválidos quedan en 0)
+        df['MONTO'] = limpiar_monto(df['MONTO'])
 
         # Convertir meses a español y manejar valores None
         if 'MES' in df.columns:
@@ -185,31 +392,23 @@ def load_budget_data():
             df['MES'] = df['MES'].fillna('Desconocido')
             df['MES'] = df['MES'].replace('None', 'Desconocido')
 
-            # Mapeo de meses
-            meses_map = {
-                'January': 'Enero',
-                'February': 'Febrero',
-                'March': 'Marzo',
-                'April': 'Abril',
-                'May': 'Mayo',
-                'June': 'Junio',
-                'July': 'Julio',
-                'August': 'Agosto',
-                'September': 'Septiembre',
-                'October': 'Octubre',
-                'November': 'Noviembre',
-                'December': 'Diciembre'
-            }
-
-            # Aplicar mapeo solo a valores conocidos
-            df['MES'] = df['MES'].apply(lambda x: meses_map.get(x, x))
+            # Mapeo de meses (valores no reconocidos se conservan)
+            df['MES'] = df['MES'].map(MESES_ES).fillna(df['MES'])
 
             # Reemplazar 'Desconocido' con el mes correspondiente a la fecha si existe columna Fecha
             if 'Fecha' in df.columns:
-                df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-                df.loc[df['MES'] == 'Desconocido', 'MES'] = df['Fecha'].dt.strftime('%B').map(meses_map)
+                df['Fecha'] = convertir_fechas(df['Fecha'])
+                desconocido = df['MES'] == 'Desconocido'
+                df.loc[desconocido, 'MES'] = mes_en_espanol(df.loc[desconocido, 'Fecha']).astype(object)
+
+            # Categoría ordenada: los filtros por mes comparan códigos enteros
+            df['MES'] = df['MES'].astype(MESES_DTYPE)
 
-        return df
+        for col in ['VDE', 'CATEGORIA', 'SUBCATEGORIA']:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+
+        return guardar_cache_disco(reducir_tipos(df), 'presupuesto')
     except Exception as e:
         st.error(f"Error al cargar datos de presupuesto: {str(e)}")
         return None
@@ -221,14 +420,18 @@ def load_clients_data():
     url = "https://docs.google.com/spreadsheets/d/1WWynEjZGN8zxlIOUab1CjjMSgXhDBd4y/export?format=csv&gid=81018902"
 
     try:
-        df = pd.read_csv(url)
+        df = leer_cache_disco('clientes')
+        if df is not None:
+            return df
+
+        df = leer_csv(url)
 
         # Verificación de columnas esenciales
         if 'CODIGO' not in df.columns or 'CLIENTE' not in df.columns:
             st.error("Faltan columnas requeridas (CODIGO o CLIENTE)")
             return None
 
-        return df
+        return guardar_cache_disco(reducir_tipos(df), 'clientes')
     except Exception as e:
         st.error(f"Error al cargar datos de clientes: {str(e)}")
         return None
@@ -239,15 +442,19 @@ def load_calls_data():
     url = "https://docs.google.com/spreadsheets/d/1Zlpdoq-lV8dpF1jITGlAHXRtmrJHhMm0/export?format=csv"
 
     try:
-        df = pd.read_csv(url)
+        df = leer_cache_disco('llamadas')
+        if df is not None:
+            return df
+
+        df = leer_csv(url)
 
         # Limpieza y transformación de datos
         df.columns = df.columns.str.strip()
         df["Duración (min)"] = df["Duración (seg)"] / 60
 
         try:
-            df["Fecha"] = pd.to_datetime(df["Archivo"].str.extract(r"(\d{4}-\d{2}-\d{2})")[0], errors="coerce")
-            df["MES"] = df["Fecha"].dt.strftime('%B').map(MESES_ES)
+            df["Fecha"] = convertir_fechas(df["Archivo"].str.extract(r"(\d{4}-\d{2}-\d{2})")[0], formato="%Y-%m-%d")
+            df["MES"] = mes_en_espanol(df["Fecha"])
         except:
             df["Fecha"] = pd.NaT
             df["MES"] = ""
@@ -259,15 +466,10 @@ def load_calls_data():
                                 (df["% Sentimiento"] * 0.3) + \
                                 (df["Puntaje Fluidez"] * 10 * 0.2)
 
-        def clasificar(p):
-            if p >= 85: return "🏆 Ejemplar"
-            elif p >= 70: return "✅ Satisfactorio"
-            elif p >= 50: return "⚠️ Necesita Mejora"
-            else: return "🔴 Crítico"
+        df["Clasificación"] = clasificar_calidad(df["Puntaje Calidad"])
+        df["Vendedor"] = df["Vendedor"].astype("category")
 
-        df["Clasificación"] = df["Puntaje Calidad"].apply(clasificar)
-
-        return df
+        return guardar_cache_disco(reducir_tipos(df), 'llamadas')
     except Exception as e:
         st.error(f"Error al cargar datos de llamadas: {str(e)}")
         return None
@@ -276,179 +478,400 @@ def load_calls_data():
 # CLASE PARA CÁLCULOS DE KPIs
 # ============================================
 
+@st.cache_data(ttl=3600, max_entries=32)
+def agregar_ventas_por_mes(df):
+    """Ventas agregadas por año, mes y vendedor (índice ordenado para búsquedas rápidas)"""
+    return df.groupby(['ANO', 'MES', 'VDE'], observed=True).agg(
+        MONTO=('MONTO', 'sum'),
+        Cantidad=('Cantidad', 'sum'),
+        Documento=('Documento', 'nunique'),
+        CODIGO=('CODIGO', 'nunique')
+    )
+
+@st.cache_data(ttl=3600)
+def presupuesto_por_mes(df):
+    """Presupuesto por vendedor para cada (año, mes), listo para consultar por clave"""
+    return {
+        clave: grupo.groupby('VDE', observed=True)[['MONTO', 'CANTIDAD']].sum()
+        for clave, grupo in df.groupby(['ANO', 'MES'], observed=True)
+    }
+
+@st.cache_data(ttl=3600)
+def presupuesto_por_categoria(df):
+    """Presupuesto sumado por (VDE, CATEGORIA) y por (VDE, CATEGORIA, SUBCATEGORIA), según las columnas que existan"""
+    agregados = {}
+    for claves in (('VDE', 'CATEGORIA'), ('VDE', 'CATEGORIA', 'SUBCATEGORIA')):
+        if all(col in df.columns for col in claves):
+            agregados[claves] = df.groupby(list(claves), observed=True, sort=False)['MONTO'].sum()
+    return agregados
+
+@st.cache_data(ttl=3600, max_entries=32)
+def cumplimiento_por(ventas_agrupadas, metas, claves):
+    """Ventas reales contra el presupuesto ya agregado por las claves dadas, con el % de cumplimiento"""
+    ventas = ventas_agrupadas.groupby(level=claves, observed=True).sum()
+    # Alinear por índice en lugar de un merge: el presupuesto se reindexa a las claves con ventas.
+    # No se concatena con el presupuesto para un solo groupby: éste ya viene agregado y en caché
+    # (presupuesto_por_categoria), así que aquí solo queda un reindex de pocas filas
+    presupuesto = metas.reindex(ventas.index)
+    return pd.DataFrame({
+        'MONTO_Real': ventas,
+        'MONTO_Presupuesto': presupuesto,
+        '% Cumplimiento': (ventas / presupuesto) * 100
+    }).reset_index()
+
+@st.cache_data(ttl=3600, max_entries=32)
+def top_productos_por_vendedor(df, n=60):
+    """Los n productos más vendidos de cada vendedor, de mayor a menor venta, en un diccionario por VDE"""
+    top = df.groupby(['VDE', 'COD_PROD', 'Descripcion'], observed=True, sort=False).agg(
+        Ventas=pd.NamedAgg(column='MONTO', aggfunc='sum'),
+        Cantidad=pd.NamedAgg(column='Cantidad', aggfunc='sum')
+    ).reset_index().sort_values('Ventas', ascending=False, kind='mergesort')
+    top = top.groupby('VDE', observed=True, sort=False).head(n)
+    grupos = dict(tuple(top.groupby('VDE', observed=True, sort=False)))
+    # Vendedores en el orden en que aparecen en los datos
+    return {vendedor: grupos.get(vendedor, top.iloc[:0]) for vendedor in df['VDE'].unique()}
+
+@st.cache_data(ttl=3600, max_entries=32)
+def cumplimiento_metas(df_filtrado, budget_df, mes, year):
+    """Ventas contra presupuesto por vendedor para un mes y año, con fila de totales"""
+    try:
+        # Presupuesto y ventas del mes y año consultados (agregados por VDE)
+        presupuesto_mes = presupuesto_por_mes(budget_df).get((year, mes))
+        ventas_mes = filas_de(agregar_ventas_por_mes(df_filtrado), (year, mes)).droplevel(['ANO', 'MES'])
+
+        # Si no hay presupuesto para este mes/año
+        if presupuesto_mes is None or presupuesto_mes.empty or presupuesto_mes['MONTO'].sum() == 0:
+            # Verificar si hay ventas para ese mes
+            if not ventas_mes.empty:
+                st.warning(f"No hay datos de presupuesto para {mes} {year}, pero sí existen ventas registradas")
+            else:
+                st.warning(f"No hay datos de presupuesto ni ventas para {mes} {year}")
+            return None
+
+        # Combinar datos alineando por el índice VDE de ambos agregados
+        cumplimiento = (
+            ventas_mes
+            .join(presupuesto_mes, how='outer', lsuffix='_real', rsuffix='_meta')
+            .fillna(0)
+            .rename_axis('VDE')
+            .reset_index()
+        )
+
+        # Calcular porcentajes de cumplimiento
+        cumplimiento['% Cumplimiento Ventas'] = (cumplimiento['MONTO_real'] / cumplimiento['MONTO_meta']) * 100
+        cumplimiento['% Cumplimiento Cajas'] = (cumplimiento['Cantidad'] / cumplimiento['CANTIDAD']) * 100
+        cumplimiento['Ticket Promedio'] = cumplimiento['MONTO_real'] / cumplimiento['Documento']
+        cumplimiento['Factura Promedio'] = cumplimiento['MONTO_real'] / cumplimiento['CODIGO']
+
+        # Agregar fila de totales (solo se suman las columnas aditivas)
+        total_row = cumplimiento[['MONTO_real', 'MONTO_meta', 'Cantidad', 'CANTIDAD', 'Documento', 'CODIGO']].sum().to_dict()
+        total_row['VDE'] = 'TOTAL'
+        total_row['% Cumplimiento Ventas'] = (total_row['MONTO_real'] / total_row['MONTO_meta']) * 100
+        total_row['% Cumplimiento Cajas'] = (total_row['Cantidad'] / total_row['CANTIDAD']) * 100
+        total_row['Ticket Promedio'] = total_row['MONTO_real'] / total_row['Documento']
+        total_row['Factura Promedio'] = total_row['MONTO_real'] / total_row['CODIGO']
+
+        if isinstance(cumplimiento['VDE'].dtype, pd.CategoricalDtype):
+            cumplimiento['VDE'] = cumplimiento['VDE'].cat.add_categories('TOTAL')
+        cumplimiento.loc[len(cumplimiento)] = total_row
+
+        return {
+            'dataframe': cumplimiento,
+            'mes': mes,
+            'year': year
+        }
+    except Exception as e:
+        st.error(f"Error al calcular cumplimiento: {str(e)}")
+        return None
+
+@st.cache_data(ttl=3600, max_entries=32)
+def kpis_basicos(df):
+    """Clientes, transacciones, frecuencia de compra y promedios del DataFrame dado"""
+    try:
+        # Una sola agrupación por cliente da el número de clientes y la frecuencia de compra
+        documentos_por_cliente = df.groupby('CODIGO', observed=True)['Documento'].nunique()
+        clientes_unicos = len(documentos_por_cliente)
+        transacciones = df['Documento'].nunique()
+        monto_total = df['MONTO'].sum()
+
+        kpis = {
+            'clientes_unicos': clientes_unicos,
+            'transacciones': transacciones,
+            'frecuencia_compra': documentos_por_cliente.mean(),
+            'ticket_promedio': monto_total / transacciones,
+            'factura_promedio': monto_total / clientes_unicos
+        }
+        return kpis
+    except Exception as e:
+        st.error(f"Error al calcular KPIs básicos: {str(e)}")
+        return None
+
+@st.cache_data(ttl=3600, max_entries=128)
+def proyeccion_de_semana(df, semana, hoy):
+    """Ventas de la semana, su proyección a 5.5 días laborables y las ventas por día para el gráfico"""
+    try:
+        df_semana = df[df['SEM'] == semana]
+
+        if df_semana.empty:
+            return None
+
+        primer_dia_semana = hoy - timedelta(days=hoy.weekday())
+        ultimo_dia_semana = primer_dia_semana + timedelta(days=6)
+
+        # Calcular días laborables (considerando sábado medio día)
+        dias_transcurridos = min((hoy - primer_dia_semana).days + 1, 5)  # Máximo 5 días laborables
+        if hoy.weekday() == 5:  # Si es sábado
+            dias_transcurridos = 5.5
+        elif hoy.weekday() == 6:  # Si es domingo
+            dias_transcurridos = 5
+
+        dias_laborables = 5.5  # Semana laboral de lunes a sábado medio día
+
+        ventas_semana = df_semana['MONTO'].sum()
+        venta_diaria_promedio = ventas_semana / dias_transcurridos if dias_transcurridos > 0 else 0
+        proyeccion = venta_diaria_promedio * dias_laborables
+
+        return {
+            'semana': semana,
+            'ventas_semana': ventas_semana,
+            'dias_transcurridos': dias_transcurridos,
+            'dias_laborables': dias_laborables,
+            'venta_diaria_promedio': venta_diaria_promedio,
+            'proyeccion': proyeccion,
+            # DIA_SEM es categórico ordenado (lunes = código 0): el groupby sale en orden de semana
+            'ventas_por_dia': df_semana.groupby('DIA_SEM', observed=True, sort=True)['MONTO'].sum().reset_index()
+        }
+    except Exception as e:
+        st.error(f"Error al calcular proyección semanal: {str(e)}")
+        return None
+
+@st.cache_data(ttl=3600, max_entries=128)
+def proyeccion_de_mes(df, mes, hoy):
+    """Ventas del mes, proyección al cierre por días laborables, promedios y ventas diarias para el gráfico"""
+    try:
+        df_mes = df[df['MES'] == mes]
+
+        if df_mes.empty:
+            return None
+
+        primer_dia_mes = hoy.replace(day=1)
+        ultimo_dia_mes = (primer_dia_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+        # Calcular días laborables (considerando sábados medio día)
+        dias_transcurridos = calcular_dias_laborables(primer_dia_mes, hoy)
+        dias_totales = calcular_dias_laborables(primer_dia_mes, ultimo_dia_mes)
+
+        # Cada reducción una sola vez: la suma y los conteos se reutilizan abajo
+        ventas_mes = df_mes['MONTO'].sum()
+        documentos = df_mes['Documento'].nunique()
+        clientes = df_mes['CODIGO'].nunique()
+        venta_diaria_promedio = ventas_mes / dias_transcurridos if dias_transcurridos > 0 else 0
+        proyeccion = venta_diaria_promedio * dias_totales
+
+        ticket_promedio = ventas_mes / documentos if documentos > 0 else 0
+        factura_promedio = ventas_mes / clientes if clientes > 0 else 0
+
+        return {
+            'mes': mes,
+            'ventas_mes': ventas_mes,
+            'dias_transcurridos': dias_transcurridos,
+            'dias_totales': dias_totales,
+            'venta_diaria_promedio': venta_diaria_promedio,
+            'proyeccion': proyeccion,
+            'ticket_promedio': ticket_promedio,
+            'factura_promedio': factura_promedio,
+            'ventas_diarias': df_mes.groupby('Fecha')['MONTO'].sum().reset_index()
+        }
+    except Exception as e:
+        st.error(f"Error al calcular proyección mensual: {str(e)}")
+        return None
+
 class KPICalculator:
     def __init__(self, sales_df, budget_df):
         self.sales_df = sales_df
         self.budget_df = budget_df
 
     def calcular_cumplimiento_metas(self, df_filtrado, mes, year):
-        try:
-            # Filtrar presupuesto por mes y año
-            presupuesto_mes = self.budget_df[
-                (self.budget_df['MES'] == mes) &
-                (self.budget_df['ANO'] == year)
-            ].groupby('VDE').agg({'MONTO': 'sum', 'CANTIDAD': 'sum'}).reset_index()
-
-            # Si no hay presupuesto para este mes/año
-            if presupuesto_mes.empty or presupuesto_mes['MONTO'].sum() == 0:
-                # Verificar si hay ventas para ese mes
-                ventas_mes = df_filtrado[
-                    (df_filtrado['MES'] == mes) &
-                    (df_filtrado['ANO'] == year)
-                ]
-
-                if not ventas_mes.empty:
-                    st.warning(f"No hay datos de presupuesto para {mes} {year}, pero sí existen ventas registradas")
-                else:
-                    st.warning(f"No hay datos de presupuesto ni ventas para {mes} {year}")
-                return None
-
-            # Filtrar ventas por mes y año
-            ventas_mes = df_filtrado[
-                (df_filtrado['MES'] == mes) &
-                (df_filtrado['ANO'] == year)
-            ].groupby('VDE').agg({
-                'MONTO': 'sum',
-                'Cantidad': 'sum',
-                'Documento': 'nunique',
-                'CODIGO': 'nunique'
-            }).reset_index()
-
-            # Combinar datos
-            cumplimiento = pd.merge(
-                ventas_mes,
-                presupuesto_mes,
-                on='VDE',
-                how='outer',
-                suffixes=('_real', '_meta')
-            ).fillna(0)
-
-            # Calcular porcentajes de cumplimiento
-            cumplimiento['% Cumplimiento Ventas'] = (cumplimiento['MONTO_real'] / cumplimiento['MONTO_meta']) * 100
-            cumplimiento['% Cumplimiento Cajas'] = (cumplimiento['Cantidad'] / cumplimiento['CANTIDAD']) * 100
-            cumplimiento['Ticket Promedio'] = cumplimiento['MONTO_real'] / cumplimiento['Documento']
-            cumplimiento['Factura Promedio'] = cumplimiento['MONTO_real'] / cumplimiento['CODIGO']
-
-            # Agregar fila de totales
-            total_row = cumplimiento.sum(numeric_only=True)
-            total_row['VDE'] = 'TOTAL'
-            total_row['% Cumplimiento Ventas'] = (total_row['MONTO_real'] / total_row['MONTO_meta']) * 100
-            total_row['% Cumplimiento Cajas'] = (total_row['Cantidad'] / total_row['CANTIDAD']) * 100
-            total_row['Ticket Promedio'] = total_row['MONTO_real'] / total_row['Documento']
-            total_row['Factura Promedio'] = total_row['MONTO_real'] / total_row['CODIGO']
-
-            cumplimiento = pd.concat([cumplimiento, pd.DataFrame([total_row])], ignore_index=True)
-
-            return {
-                'dataframe': cumplimiento,
-                'mes': mes,
-                'year': year
-            }
-        except Exception as e:
-            st.error(f"Error al calcular cumplimiento: {str(e)}")
-            return None
+        return cumplimiento_metas(df_filtrado, self.budget_df, mes, year)
 
     def calcular_kpis_basicos(self, df):
-        try:
-            kpis = {
-                'clientes_unicos': df['CODIGO'].nunique(),
-                'transacciones': df['Documento'].nunique(),
-                'frecuencia_compra': df.groupby('CODIGO')['Documento'].nunique().mean(),
-                'ticket_promedio': df['MONTO'].sum() / df['Documento'].nunique(),
-                'factura_promedio': df['MONTO'].sum() / df['CODIGO'].nunique()
-            }
-            return kpis
-        except Exception as e:
-            st.error(f"Error al calcular KPIs básicos: {str(e)}")
-            return None
+        return kpis_basicos(df)
 
     def calcular_proyeccion_semanal(self, df, semana):
-        try:
-            df_semana = df[df['SEM'] == semana]
-
-            if df_semana.empty:
-                return None
-
-            hoy = datetime.now().date()
-            primer_dia_semana = hoy - timedelta(days=hoy.weekday())
-            ultimo_dia_semana = primer_dia_semana + timedelta(days=6)
-
-            # Calcular días laborables (considerando sábado medio día)
-            dias_transcurridos = min((hoy - primer_dia_semana).days + 1, 5)  # Máximo 5 días laborables
-            if hoy.weekday() == 5:  # Si es sábado
-                dias_transcurridos = 5.5
-            elif hoy.weekday() == 6:  # Si es domingo
-                dias_transcurridos = 5
-
-            dias_laborables = 5.5  # Semana laboral de lunes a sábado medio día
-
-            ventas_semana = df_semana['MONTO'].sum()
-            venta_diaria_promedio = ventas_semana / dias_transcurridos if dias_transcurridos > 0 else 0
-            proyeccion = venta_diaria_promedio * dias_laborables
-
-            return {
-                'semana': semana,
-                'ventas_semana': ventas_semana,
-                'dias_transcurridos': dias_transcurridos,
-                'dias_laborables': dias_laborables,
-                'venta_diaria_promedio': venta_diaria_promedio,
-                'proyeccion': proyeccion
-            }
-        except Exception as e:
-            st.error(f"Error al calcular proyección semanal: {str(e)}")
-            return None
+        # La fecha de hoy forma parte de la clave: la proyección cambia con los días transcurridos
+        return proyeccion_de_semana(df, semana, datetime.now().date())
 
     def calcular_proyeccion_mensual(self, df, mes):
-        try:
-            df_mes = df[df['MES'] == mes]
-
-            if df_mes.empty:
-                return None
-
-            hoy = datetime.now().date()
-            primer_dia_mes = hoy.replace(day=1)
-            ultimo_dia_mes = (primer_dia_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-
-            # Calcular días laborables (considerando sábados medio día)
-            def calcular_dias_laborables(start, end):
-                dias = 0
-                current = start
-                while current <= end:
-                    if current.weekday() < 5:  # Lunes a Viernes
-                        dias += 1
-                    elif current.weekday() == 5:  # Sábado
-                        dias += 0.5
-                    current += timedelta(days=1)
-                return dias
-
-            dias_transcurridos = calcular_dias_laborables(primer_dia_mes, hoy)
-            dias_totales = calcular_dias_laborables(primer_dia_mes, ultimo_dia_mes)
-
-            ventas_mes = df_mes['MONTO'].sum()
-            venta_diaria_promedio = ventas_mes / dias_transcurridos if dias_transcurridos > 0 else 0
-            proyeccion = venta_diaria_promedio * dias_totales
-
-            ticket_promedio = df_mes['MONTO'].sum() / df_mes['Documento'].nunique() if df_mes['Documento'].nunique() > 0 else 0
-            factura_promedio = df_mes['MONTO'].sum() / df_mes['CODIGO'].nunique() if df_mes['CODIGO'].nunique() > 0 else 0
-
-            return {
-                'mes': mes,
-                'ventas_mes': ventas_mes,
-                'dias_transcurridos': dias_transcurridos,
-                'dias_totales': dias_totales,
-                'venta_diaria_promedio': venta_diaria_promedio,
-                'proyeccion': proyeccion,
-                'ticket_promedio': ticket_promedio,
-                'factura_promedio': factura_promedio
-            }
-        except Exception as e:
-            st.error(f"Error al calcular proyección mensual: {str(e)}")
-            return None
+        return proyeccion_de_mes(df, mes, datetime.now().date())
 
 # ============================================
 # FUNCIONES AUXILIARES
 # ============================================
 
+def filas_de(indexado, clave):
+    """Filas de un DataFrame con índice ordenado que coinciden con la clave (vacío si no existe)"""
+    try:
+        posicion = indexado.index.get_loc(clave)
+    except KeyError:
+        return indexado.iloc[:0]
+    if isinstance(posicion, (int, np.integer)):
+        posicion = slice(posicion, posicion + 1)
+    return indexado.iloc[posicion]
+
+@st.cache_data(ttl=3600)
+def opciones_filtro(df):
+    """Valores únicos ordenados de las columnas usadas en los filtros del sidebar"""
+    return {
+        'ANO': sorted(df['ANO'].unique(), reverse=True),
+        'MES': df['MES'].unique().sort_values().tolist(),  # Orden cronológico de MESES_DTYPE
+        'VDE': sorted(df['VDE'].unique()),
+        'COD_PROD': sorted(df['COD_PROD'].unique()),
+        'Descripcion': sorted(df['Descripcion'].unique()),
+        'CLIENTE': sorted(df['CLIENTE'].unique()),
+        'SEM': {ano: sorted(semanas, reverse=True) for ano, semanas in df.groupby('ANO', sort=False)['SEM'].unique().items()}
+    }
+
+@st.cache_data(ttl=3600)
+def mapas_producto(df):
+    """Diccionarios código → descripción y descripción → código (primera aparición de cada uno)"""
+    codigo_a_descripcion = df.drop_duplicates('COD_PROD').set_index('COD_PROD')['Descripcion'].to_dict()
+    descripcion_a_codigo = df.drop_duplicates('Descripcion').set_index('Descripcion')['COD_PROD'].to_dict()
+    return codigo_a_descripcion, descripcion_a_codigo
+
+@st.cache_data(ttl=3600)
+def rango_fechas(fechas):
+    """Primera y última fecha de la serie (hoy si no hay fechas válidas)"""
+    if fechas.isnull().all():
+        hoy = pd.to_datetime('today').date()
+        return hoy, hoy
+    return fechas.min().date(), fechas.max().date()
+
+def en_seleccion(serie, valores):
+    """Máscara booleana de las filas cuyo valor está en la selección (por códigos si la serie es categórica)"""
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.isin(valores)
+    categorias = serie.cat.categories
+    posiciones = categorias.get_indexer(list(valores))
+    # Tabla de verdad por código; la posición extra queda en False y la usan los nulos (código -1)
+    tabla = np.zeros(len(categorias) + 1, dtype=bool)
+    tabla[posiciones[posiciones >= 0]] = True
+    return pd.Series(tabla[serie.cat.codes.to_numpy()], index=serie.index)
+
+def filtrar_ano_vendedores(df, year, vendedores):
+    """Filas del año dado cuyos vendedores están en la selección (máscara en NumPy y una sola extracción)"""
+    mascara = (df['ANO'].to_numpy() == year) & en_seleccion(df['VDE'], vendedores).to_numpy()
+    return df.iloc[np.flatnonzero(mascara)]
+
+def calcular_dias_laborables(start, end):
+    """Días laborables entre dos fechas inclusive (lunes a viernes completos, sábado medio día)"""
+    fin = end + timedelta(days=1)  # busday_count excluye el último día
+    lunes_a_viernes = np.busday_count(start, fin, weekmask='1111100')
+    sabados = np.busday_count(start, fin, weekmask='0000010')
+    return float(lunes_a_viernes + 0.5 * sabados)
+
+@st.cache_data(ttl=3600, max_entries=32)
+def frecuencias_palabras(transcripciones):
+    """Frecuencias de WordCloud.process_text (sin números, plurales unidos y frases de dos palabras) sin unir todo el texto"""
+    # Solo se importa al abrir el análisis de lenguaje
+    from wordcloud import STOPWORDS
+    from wordcloud.tokenization import unigrams_and_bigrams
+    # Mismos pasos que process_text con la configuración por defecto, pero tokenizando fila por fila
+    tokens = transcripciones.dropna().astype(str).str.findall(r"\w[\w']*")
+    palabras = [p[:-2] if p.lower().endswith("'s") else p for p in chain.from_iterable(tokens)]
+    palabras = [p for p in palabras if not p.isdigit()]
+    return unigrams_and_bigrams(palabras, {p.lower() for p in STOPWORDS}, True, 30)
+
+@st.cache_data(ttl=3600, max_entries=32)
+def imagen_nube_palabras(frecuencias):
+    """Imagen (arreglo RGB) de la nube de palabras para unas frecuencias dadas"""
+    from wordcloud import WordCloud
+    wc = WordCloud(width=800, height=400, background_color="white").generate_from_frequencies(frecuencias)
+    return wc.to_array()
+
+def indices_lttb(x, y, n_salida):
+    """Posiciones de los puntos que conserva LTTB (Largest-Triangle-Three-Buckets) para n_salida puntos"""
+    n = len(x)
+    if n_salida >= n or n_salida < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # El primer y el último punto se conservan; el resto se reparte en n_salida - 2 cubetas
+    bordes = np.append(np.linspace(1, n - 1, n_salida - 1).astype(np.int64), n)
+    elegidos = np.empty(n_salida, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    for i in range(n_salida - 2):
+        inicio, fin, fin_siguiente = bordes[i], bordes[i + 1], bordes[i + 2]
+        xa, ya = x[elegidos[i]], y[elegidos[i]]
+        xc, yc = x[fin:fin_siguiente].mean(), y[fin:fin_siguiente].mean()
+        # Punto de la cubeta que forma el triángulo de mayor área con el anterior y el promedio siguiente
+        areas = np.abs((xa - xc) * (y[inicio:fin] - ya) - (xa - x[inicio:fin]) * (yc - ya))
+        elegidos[i + 1] = inicio + areas.argmax()
+    return elegidos
+
+@st.cache_data(ttl=3600, max_entries=64)
+def grafico_semana(ventas_por_dia, semana):
+    """Figura de la evolución de ventas por día de la semana (se reutiliza mientras la agregación no cambie)"""
+    fig = px.line(
+        ventas_por_dia,
+        x='DIA_SEM',
+        y='MONTO',
+        title=f"Evolución Semana {semana}",
+        markers=True,
+        labels={'MONTO': 'Ventas ($)', 'DIA_SEM': 'Día de la semana'}
+    )
+    fig.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(
+            showgrid=False,
+            categoryorder='array',
+            categoryarray=DIAS_SEMANA
+        ),
+        yaxis=dict(showgrid=False),
+        height=300,
+        margin=dict(l=40, r=40, t=40, b=40)
+    )
+    return fig
+
+@st.cache_data(ttl=3600, max_entries=64)
+def grafico_ventas_diarias(ventas_diarias, mes):
+    """Figura de la evolución de ventas diarias del mes (se reutiliza mientras la agregación no cambie)"""
+    fig = px.line(
+        ventas_diarias,
+        x='Fecha',
+        y='MONTO',
+        title=f'Evolución de Ventas Diarias - {mes}',
+        markers=True
+    )
+    fig.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(showgrid=False),
+        yaxis=dict(showgrid=False)
+    )
+    return fig
+
+def color_cumplimiento(columna):
+    """Estilo CSS por celda para un % de cumplimiento: verde desde 100, naranja desde 70, rojo debajo"""
+    valores = pd.to_numeric(columna, errors='coerce').to_numpy(dtype=float)
+    return np.select([valores >= 100, valores >= 70, valores < 70],
+                     ['color: green', 'color: orange', 'color: red'], default='')
+
+@st.cache_data(ttl=3600, max_entries=8)
+def bytes_excel(detalle, agrupado=None):
+    """Contenido del archivo Excel de exportación (hoja Detalle y, si hay agrupación, Agrupado)"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        detalle.to_excel(writer, index=False, sheet_name='Detalle')
+        if agrupado is not None:
+            agrupado.to_excel(writer, index=False, sheet_name='Agrupado')
+    return output.getvalue()
+
+@st.cache_data(ttl=3600, max_entries=8)
+def bytes_csv(detalle):
+    """Contenido del archivo CSV de exportación"""
+    return detalle.to_csv(index=False, sep=';', encoding='utf-8-sig').encode('utf-8')
+
 def format_monto(value):
     return f"${value:,.2f}"
 
@@ -468,6 +891,134 @@ def crear_card(title, value, value_type='monto'):
     </div>
     """
 
+# ============================================
+# PESTAÑAS DEL MÓDULO DE LLAMADAS
+# ============================================
+# Cada pestaña es un fragmento: sus widgets solo vuelven a ejecutar su propia pestaña
+
+@st.fragment
+def mostrar_resumen_llamadas(df_filtrado):
+    """Pestaña de resumen general del equipo"""
+    st.subheader("Resumen general del equipo")
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Promedio Apego (%)", f"{df_filtrado['% Apego al guion'].mean():.1f}%")
+    col2.metric("Promedio Sentimiento (%)", f"{df_filtrado['% Sentimiento'].mean():.1f}%")
+    col3.metric("Llamadas analizadas", len(df_filtrado))
+    col4.metric("Duración promedio (min)", f"{df_filtrado['Duración (min)'].mean():.1f}")
+
+    # Comparativa por vendedor
+    fig_bar = px.bar(
+        df_filtrado.groupby("Vendedor", observed=True)["% Apego al guion"].mean().reset_index(),
+        x="Vendedor",
+        y="% Apego al guion",
+        title="Apego al guion por vendedor",
+        color="% Apego al guion",
+        color_continuous_scale="RdYlGn"
+    )
+    st.plotly_chart(fig_bar, use_container_width=True)
+
+    # Tabla de calidad promedio por vendedor
+    st.markdown("### 🏅 Calidad promedio por vendedor")
+    calidad_vendedores = df_filtrado.groupby("Vendedor", observed=True)[["Puntaje Calidad"]].mean().reset_index()
+    calidad_vendedores["Clasificación"] = clasificar_calidad(calidad_vendedores["Puntaje Calidad"])
+    st.dataframe(calidad_vendedores)
+
+@st.fragment
+def mostrar_llamadas_vendedor(df_filtrado):
+    """Pestaña de desempeño de un vendedor"""
+    vendedor_sel = st.selectbox(
+        "Seleccionar vendedor",
+        options=df_filtrado["Vendedor"].unique()
+    )
+    df_vend = df_filtrado[df_filtrado["Vendedor"] == vendedor_sel]
+
+    st.subheader(f"Desempeño de {vendedor_sel}")
+
+    # Gauge Apego
+    if not df_vend.empty:
+        apego = df_vend["% Apego al guion"].mean()
+        fig_gauge = go.Figure(go.Indicator(
+            mode="gauge+number",
+            value=apego,
+            title={'text': "Apego al guion (%)"},
+            gauge={'axis': {'range': [0, 100]},
+                   'bar': {'color': "green" if apego >= 80 else "orange" if apego >= 50 else "red"}}
+        ))
+        st.plotly_chart(fig_gauge, use_container_width=True)
+
+    # Tabla con clasificación por llamada
+    st.markdown("### 📋 Calidad de llamadas")
+    st.dataframe(df_vend[[
+        "Archivo", "Duración (min)", "% Apego al guion",
+        "% Sentimiento", "Puntaje Calidad", "Clasificación"
+    ]])
+
+@st.fragment
+def mostrar_lenguaje_llamadas(df_filtrado):
+    """Pestaña de análisis de lenguaje (nube de palabras, muletillas, tono y energía)"""
+    st.subheader("Análisis de lenguaje")
+
+    # Nube de palabras
+    frecuencias = frecuencias_palabras(df_filtrado["Transcripción completa"])
+    if frecuencias:
+        st.image(imagen_nube_palabras(frecuencias), caption="Nube de palabras", use_container_width=True)
+
+    # Palabras de relleno
+    if "Transcripción completa" in df_filtrado.columns:
+        transcripciones = df_filtrado["Transcripción completa"].dropna().astype(str)
+        conteo_relleno = Counter(m.group(0).lower() for texto in transcripciones for m in PALABRAS_RELLENO.finditer(texto))
+        df_relleno = pd.DataFrame(
+            conteo_relleno.items(),
+            columns=["Palabra", "Frecuencia"]
+        ).sort_values(by="Frecuencia", ascending=False)
+
+        st.markdown("### 📊 Distribución de palabras de relleno")
+        fig_fill = px.bar(
+            df_relleno,
+            x="Palabra",
+            y="Frecuencia",
+            title="Frecuencia de palabras de relleno"
+        )
+        st.plotly_chart(fig_fill, use_container_width=True)
+        st.dataframe(df_relleno)
+
+    # Comparativa de energía y tono
+    if "Energía de voz" in df_filtrado.columns and "Tono promedio" in df_filtrado.columns:
+        fig_scatter = px.scatter(
+            df_filtrado,
+            x="Tono promedio",
+            y="Energía de voz",
+            color="% Apego al guion",
+            size="Tasa de habla",
+            title="Tono vs Energía",
+            render_mode='webgl'
+        )
+        st.plotly_chart(fig_scatter, use_container_width=True)
+
+# ============================================
+# SECCIONES DEL MÓDULO DE CUMPLIMIENTO
+# ============================================
+
+@st.fragment
+def mostrar_top_productos(top_productos):
+    """Productos más vendidos del vendedor elegido; cambiar de vendedor solo vuelve a ejecutar esta sección"""
+    if not top_productos:
+        st.info("No hay productos vendidos con los filtros actuales")
+        return
+
+    vendedor = st.selectbox(
+        "Vendedor",
+        options=list(top_productos),
+        key="top_productos_vendedor"
+    )
+    st.dataframe(
+        top_productos[vendedor][['COD_PROD', 'Descripcion', 'Ventas', 'Cantidad']],
+        column_config=FORMATO_TOP_PRODUCTOS,
+        use_container_width=True,
+        hide_index=True
+    )
+
 # ============================================
 # INTERFAZ PRINCIPAL
 # ============================================
@@ -484,10 +1035,10 @@ def main():
     
     st.title(f"📊 Panel de Control Comercial - {usuario_actual}")
 
-    # Cargar datos
-    sales_df = load_sales_data()
-    budget_df = load_budget_data()
-    calls_df = load_calls_data()
+    # Cargar datos en paralelo: con la caché vacía cada hoja espera su propia descarga
+    # (los hilos reciben el contexto de Streamlit para poder mostrar errores)
+    with ThreadPoolExecutor(max_workers=3, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())) as executor:
+        sales_df, budget_df, calls_df = executor.map(lambda cargar: cargar(), [load_sales_data, load_budget_data, load_calls_data])
 
     if sales_df is None or budget_df is None or calls_df is None:
         st.error("No se pudieron cargar los datos necesarios. Por favor intente más tarde.")
@@ -510,8 +1061,11 @@ def main():
     # Filtros globales en el sidebar
     st.sidebar.header("🔎 Filtros Globales")
 
+    # Opciones de los filtros (calculadas una vez por carga de datos)
+    opciones = opciones_filtro(sales_df)
+
     # Año (común a varios módulos)
-    available_years = sorted(sales_df['ANO'].unique(), reverse=True)
+    available_years = opciones['ANO']
     year_filter = st.sidebar.selectbox("Año", available_years)
 
     # Módulo de Consulta
@@ -525,9 +1079,12 @@ def main():
         with col2:
             if st.button("🔄 Recargar Datos", help="Actualizar datos desde Google Drive"):
                 st.cache_data.clear()  # Limpiar caché para forzar recarga
+                limpiar_cache_disco()
         with col3:
             last_update = st.empty()  # Espacio reservado para mostrar última actualización
 
+        codigo_a_descripcion, descripcion_a_codigo = mapas_producto(sales_df)
+
         # Sidebar para filtros específicos de consulta
         with st.sidebar:
             st.header("🔎 Filtros de Consulta")
@@ -535,19 +1092,18 @@ def main():
             search_option = st.radio("Buscar por:", ["Código", "Descripción", "Cliente"])
 
             if search_option == "Código":
-                codigos = sorted(sales_df['COD_PROD'].unique())
+                codigos = opciones['COD_PROD']
                 cod_input = st.selectbox("Seleccione código de producto", codigos)
             elif search_option == "Descripción":
-                descripciones = sorted(sales_df['Descripcion'].unique())
+                descripciones = opciones['Descripcion']
                 desc_selected = st.selectbox("Seleccione descripción", descripciones)
-                cod_input = sales_df[sales_df['Descripcion'] == desc_selected]['COD_PROD'].iloc[0]
+                cod_input = descripcion_a_codigo[desc_selected]
             else:
-                clientes = sorted(sales_df['CLIENTE'].unique())
+                clientes = opciones['CLIENTE']
                 cliente_sel = st.selectbox("Seleccione cliente", clientes)
                 cod_input = None
 
-            min_date = sales_df['Fecha'].min().date() if not sales_df['Fecha'].isnull().all() else pd.to_datetime('today').date()
-            max_date = sales_df['Fecha'].max().date() if not sales_df['Fecha'].isnull().all() else pd.to_datetime('today').date()
+            min_date, max_date = rango_fechas(sales_df['Fecha'])
 
             col1, col2 = st.columns(2)
             with col1:
@@ -555,32 +1111,29 @@ def main():
             with col2:
                 fecha_fin = st.date_input("Hasta", max_date)
 
-            vendedores = sorted(sales_df['VDE'].unique())
+            vendedores = opciones['VDE']
             vendedores_sel = st.multiselect("Vendedor(es)", vendedores)
 
             group_by = st.selectbox("Agrupar por", ["Ninguno", "Vendedor", "Cliente", "Mes", "Año"])
 
-        # Aplicar filtros
+        # Aplicar filtros (comparando datetime64 directamente, sin crear un date por fila)
+        desde = pd.Timestamp(fecha_inicio)
+        hasta = pd.Timestamp(fecha_fin) + pd.Timedelta(days=1)
+        en_rango = (sales_df['Fecha'] >= desde) & (sales_df['Fecha'] < hasta)
+
         if search_option == "Cliente":
-            mask = (
-                (sales_df['CLIENTE'] == cliente_sel) &
-                (sales_df['Fecha'].dt.date >= fecha_inicio) &
-                (sales_df['Fecha'].dt.date <= fecha_fin)
-            )
+            mask = (sales_df['CLIENTE'] == cliente_sel) & en_rango
             titulo = f"Ventas para el cliente: {cliente_sel}"
         else:
-            mask = (
-                (sales_df['COD_PROD'] == cod_input) &
-                (sales_df['Fecha'].dt.date >= fecha_inicio) &
-                (sales_df['Fecha'].dt.date <= fecha_fin)
-            )
-            producto = sales_df[sales_df['COD_PROD'] == cod_input]['Descripcion'].iloc[0]
+            mask = (sales_df['COD_PROD'] == cod_input) & en_rango
+            producto = codigo_a_descripcion[cod_input]
             titulo = f"Ventas para: {cod_input} - {producto}"
 
         if vendedores_sel:
-            mask &= sales_df['VDE'].isin(vendedores_sel)
+            mask &= en_seleccion(sales_df['VDE'], vendedores_sel)
 
-        resultado = sales_df[mask].copy().sort_values('Fecha')
+        # .loc con máscara ya devuelve un DataFrame nuevo; solo se copian las columnas necesarias
+        resultado = sales_df.loc[mask, COLUMNAS_CONSULTA].sort_values('Fecha', kind='mergesort')
 
         if not resultado.empty:
             resultado['Fecha_mostrar'] = resultado['Fecha'].dt.strftime('%d/%m/%Y')
@@ -590,7 +1143,7 @@ def main():
             # Agrupación de datos
             if group_by != "Ninguno":
                 if group_by == "Mes":
-                    resultado['Grupo'] = resultado['Fecha'].dt.to_period('M').astype(str)
+                    resultado['Grupo'] = resultado['Fecha'].dt.strftime('%Y-%m')
                 elif group_by == "Año":
                     resultado['Grupo'] = resultado['Fecha'].dt.year.astype(str)
                 elif group_by == "Vendedor":
@@ -598,12 +1151,11 @@ def main():
                 else:  # Cliente
                     resultado['Grupo'] = resultado['CLIENTE']
 
-                grouped = resultado.groupby('Grupo').agg({
-                    'Cantidad': 'sum',
-                    'MONTO': 'sum',
-                    'Documento': 'nunique'
-                }).reset_index()
-                grouped.rename(columns={'Documento': 'Transacciones'}, inplace=True)
+                grouped = resultado.groupby('Grupo', observed=True).agg(
+                    Cantidad=('Cantidad', 'sum'),
+                    MONTO=('MONTO', 'sum'),
+                    Transacciones=('Documento', 'nunique')
+                ).reset_index()
 
                 st.subheader(f"📊 Ventas agrupadas por {group_by.lower()}")
                 st.dataframe(grouped)
@@ -662,14 +1214,17 @@ def main():
 
             # Gráfico de línea
             if len(resultado) > 1:
+                puntos = resultado.iloc[indices_lttb(resultado['Fecha'].to_numpy().astype('datetime64[ns]').astype(np.int64),
+                                                     resultado['MONTO'].to_numpy(), MAX_PUNTOS_GRAFICO)]
                 fig = px.line(
-                    resultado,
+                    puntos,
                     x='Fecha',
                     y='MONTO',
                     title='Evolución de Ventas por Fecha',
                     markers=True,
                     labels={'MONTO': 'Monto', 'Fecha': 'Fecha'},
-                    hover_data=['CLIENTE', 'VDE', 'Cantidad']
+                    hover_data=['CLIENTE', 'VDE', 'Cantidad'],
+                    render_mode='webgl'
                 )
                 fig.update_layout(
                     xaxis_title="Fecha",
@@ -684,24 +1239,18 @@ def main():
             export_format = st.radio("Formato de exportación:", ["Excel", "CSV"])
 
             try:
+                detalle = resultado.drop(columns=['Fecha_mostrar'])
                 if export_format == "Excel":
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        resultado.drop(columns=['Fecha_mostrar']).to_excel(
-                            writer, index=False, sheet_name='Detalle')
-                        if group_by != "Ninguno":
-                            grouped.to_excel(writer, index=False, sheet_name='Agrupado')
                     st.download_button(
                         label="⬇️ Descargar Excel",
-                        data=output.getvalue(),
+                        data=bytes_excel(detalle, grouped if group_by != "Ninguno" else None),
                         file_name="reporte_ventas.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
                 else:
                     st.download_button(
                         label="⬇️ Descargar CSV",
-                        data=resultado.drop(columns=['Fecha_mostrar'])
-                            .to_csv(index=False, sep=';', encoding='utf-8-sig').encode('utf-8'),
+                        data=bytes_csv(detalle),
                         file_name="reporte_ventas.csv",
                         mime="text/csv"
                     )
@@ -740,7 +1289,7 @@ def main():
         # Aplicar filtros
         df_filtrado = calls_df.copy()
         if vendedores:
-            df_filtrado = df_filtrado[df_filtrado["Vendedor"].isin(vendedores)]
+            df_filtrado = df_filtrado[en_seleccion(df_filtrado["Vendedor"], vendedores)]
         if fecha_min and fecha_max:
             df_filtrado = df_filtrado[
                 (df_filtrado["Fecha"] >= pd.to_datetime(fecha_min)) &
@@ -751,100 +1300,13 @@ def main():
         tab1, tab2, tab3 = st.tabs(["📊 Resumen general", "👤 Vista por vendedor", "🗣 Análisis de lenguaje"])
 
         with tab1:
-            st.subheader("Resumen general del equipo")
-
-            col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Promedio Apego (%)", f"{df_filtrado['% Apego al guion'].mean():.1f}%")
-            col2.metric("Promedio Sentimiento (%)", f"{df_filtrado['% Sentimiento'].mean():.1f}%")
-            col3.metric("Llamadas analizadas", len(df_filtrado))
-            col4.metric("Duración promedio (min)", f"{df_filtrado['Duración (min)'].mean():.1f}")
-
-            # Comparativa por vendedor
-            fig_bar = px.bar(
-                df_filtrado.groupby("Vendedor")["% Apego al guion"].mean().reset_index(),
-                x="Vendedor",
-                y="% Apego al guion",
-                title="Apego al guion por vendedor",
-                color="% Apego al guion",
-                color_continuous_scale="RdYlGn"
-            )
-            st.plotly_chart(fig_bar, use_container_width=True)
-
-            # Tabla de calidad promedio por vendedor
-            st.markdown("### 🏅 Calidad promedio por vendedor")
-            calidad_vendedores = df_filtrado.groupby("Vendedor")[["Puntaje Calidad"]].mean().reset_index()
-            calidad_vendedores["Clasificación"] = calidad_vendedores["Puntaje Calidad"].apply(
-                lambda x: df_filtrado["Clasificación"].iloc[0] if len(df_filtrado) else ""
-            )
-            st.dataframe(calidad_vendedores)
+            mostrar_resumen_llamadas(df_filtrado)
 
         with tab2:
-            vendedor_sel = st.selectbox(
-                "Seleccionar vendedor",
-                options=df_filtrado["Vendedor"].unique()
-            )
-            df_vend = df_filtrado[df_filtrado["Vendedor"] == vendedor_sel]
-
-            st.subheader(f"Desempeño de {vendedor_sel}")
-
-            # Gauge Apego
-            if not df_vend.empty:
-                apego = df_vend["% Apego al guion"].mean()
-                fig_gauge = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=apego,
-                    title={'text': "Apego al guion (%)"},
-                    gauge={'axis': {'range': [0, 100]},
-                           'bar': {'color': "green" if apego >= 80 else "orange" if apego >= 50 else "red"}}
-                ))
-                st.plotly_chart(fig_gauge, use_container_width=True)
-
-            # Tabla con clasificación por llamada
-            st.markdown("### 📋 Calidad de llamadas")
-            st.dataframe(df_vend[[
-                "Archivo", "Duración (min)", "% Apego al guion",
-                "% Sentimiento", "Puntaje Calidad", "Clasificación"
-            ]])
+            mostrar_llamadas_vendedor(df_filtrado)
 
         with tab3:
-            st.subheader("Análisis de lenguaje")
-
-            # Nube de palabras
-            texto_completo = " ".join(df_filtrado["Transcripción completa"].dropna().astype(str))
-            if texto_completo:
-                wc = WordCloud(width=800, height=400, background_color="white").generate(texto_completo)
-                st.image(wc.to_array(), caption="Nube de palabras", use_container_width=True)
-
-            # Palabras de relleno
-            if "Transcripción completa" in df_filtrado.columns:
-                palabras_relleno = re.findall(r"\b(eh|este|o sea|mmm|ah)\b", texto_completo.lower())
-                conteo_relleno = Counter(palabras_relleno)
-                df_relleno = pd.DataFrame(
-                    conteo_relleno.items(),
-                    columns=["Palabra", "Frecuencia"]
-                ).sort_values(by="Frecuencia", ascending=False)
-
-                st.markdown("### 📊 Distribución de palabras de relleno")
-                fig_fill = px.bar(
-                    df_relleno,
-                    x="Palabra",
-                    y="Frecuencia",
-                    title="Frecuencia de palabras de relleno"
-                )
-                st.plotly_chart(fig_fill, use_container_width=True)
-                st.dataframe(df_relleno)
-
-            # Comparativa de energía y tono
-            if "Energía de voz" in df_filtrado.columns and "Tono promedio" in df_filtrado.columns:
-                fig_scatter = px.scatter(
-                    df_filtrado,
-                    x="Tono promedio",
-                    y="Energía de voz",
-                    color="% Apego al guion",
-                    size="Tasa de habla",
-                    title="Tono vs Energía"
-                )
-                st.plotly_chart(fig_scatter, use_container_width=True)
+            mostrar_lenguaje_llamadas(df_filtrado)
 
     # Módulo de Cumplimiento
     elif module == "Cumplimiento":
@@ -855,7 +1317,7 @@ def main():
             st.header("Filtros de Cumplimiento")
 
             # Selección de meses - ahora ordenados cronológicamente
-            meses_disponibles = sorted(sales_df['MES'].unique(), key=lambda x: MESES_ORDEN.index(x))
+            meses_disponibles = opciones['MES']
             meses_seleccionados = st.multiselect(
                 "Seleccionar mes(es)",
                 options=meses_disponibles,
@@ -863,7 +1325,7 @@ def main():
             )
 
             # Selección de vendedores
-            vendedores_disponibles = sorted(sales_df['VDE'].unique())
+            vendedores_disponibles = opciones['VDE']
             vendedores_seleccionados = st.multiselect(
                 "Seleccionar vendedor(es)",
                 options=vendedores_disponibles,
@@ -875,10 +1337,7 @@ def main():
             return
 
         # Filtrar datos por año y vendedores seleccionados
-        current_df = sales_df[
-            (sales_df['ANO'] == year_filter) &
-            (sales_df['VDE'].isin(vendedores_seleccionados))
-        ]
+        current_df = filtrar_ano_vendedores(sales_df, year_filter, vendedores_seleccionados)
 
         if current_df.empty:
             st.warning("No hay datos disponibles con los filtros seleccionados")
@@ -889,17 +1348,9 @@ def main():
         cumplimiento = kpi_calculator.calcular_cumplimiento_metas(current_df, mes_analisis, year_filter)
 
         if cumplimiento:
-            df_renombrado = cumplimiento['dataframe'].rename(columns={
-                'MONTO_real': 'MONTO REAL',
-                'MONTO_meta': 'MONTO META',
-                'Cantidad': 'CANTIDAD REAL',
-                'CANTIDAD': 'CANTIDAD META',
-                'VDE': 'VENDEDOR',
-                'Documento': 'FACTURAS',
-                'CODIGO': 'CLIENTES',
-                '% Cumplimiento Ventas': '% CUMPL. VENTAS',
-                '% Cumplimiento Cajas': '% CUMPL. CANTIDAD'
-            })
+            # Cada llamada devuelve un DataFrame propio (copia de la caché) que solo se lee después: renombrar sin copiarlo
+            df_renombrado = cumplimiento['dataframe']
+            df_renombrado.rename(columns=COLUMNAS_CUMPLIMIENTO, inplace=True)
 
             st.dataframe(
                 df_renombrado.style.format({
@@ -913,12 +1364,7 @@ def main():
                     'FACTURAS': "{:,}",
                     'Ticket Promedio': "${:,.2f}",
                     'Factura Promedio': "${:,.2f}"
-                }).map(
-                    lambda x: 'color: green' if isinstance(x, (int, float)) and x >= 100 else
-                            'color: orange' if isinstance(x, (int, float)) and x >= 70 else
-                            'color: red' if isinstance(x, (int, float)) and x < 70 else '',
-                    subset=['% CUMPL. VENTAS', '% CUMPL. CANTIDAD']
-                ),
+                }).apply(color_cumplimiento, subset=['% CUMPL. VENTAS', '% CUMPL. CANTIDAD']),
                 use_container_width=True
             )
 
@@ -949,13 +1395,6 @@ def main():
                 primer_dia_mes = hoy.replace(day=1)
                 ultimo_dia_mes = (primer_dia_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
 
-                def calcular_dias_laborables(start, end):
-                    return sum(
-                        0.5 if (start + timedelta(days=i)).weekday() == 5 else
-                        1 if (start + timedelta(days=i)).weekday() != 6 else 0
-                        for i in range((end - start).days + 1)
-                    )
-
                 dias_transcurridos = calcular_dias_laborables(primer_dia_mes, hoy)
                 dias_totales = calcular_dias_laborables(primer_dia_mes, ultimo_dia_mes)
                 dias_faltantes = max(0, dias_totales - dias_transcurridos)
@@ -1078,54 +1517,41 @@ def main():
             # Tabla de Ventas por Vendedor y Mes - Versión corregida con orden de meses
             st.markdown("### 📊 Ventas por Vendedor y Mes")
 
-            # Crear un DataFrame pivote con los meses ordenados
-            ventas_por_mes = current_df.pivot_table(
-                index='VDE',
-                columns='MES',
-                values='MONTO',
-                aggfunc='sum',
-                fill_value=0
+            # Una sola agrupación de current_df; las tablas por mes, categoría y subcategoría se derivan de ella
+            # (suma con el motor Cython: con claves categóricas domina la factorización y engine='numba' no gana nada)
+            claves_ventas = ['VDE', 'MES'] + [col for col in ['CATEGORIA', 'SUBCATEGORIA'] if col in current_df.columns]
+            ventas_agrupadas = (
+                current_df.loc[:, claves_ventas + ['MONTO']]  # Solo las columnas que usa la agrupación
+                .groupby(claves_ventas, observed=True, sort=False, dropna=False)['MONTO'].sum()
             )
 
-            # Reordenar las columnas según MESES_ORDEN, manteniendo solo los meses existentes
-            meses_existentes = [mes for mes in MESES_ORDEN if mes in ventas_por_mes.columns]
-            ventas_por_mes = ventas_por_mes[meses_existentes]
+            # Presupuesto por categoría y subcategoría: se agrega una vez por carga de datos
+            metas_por_categoria = presupuesto_por_categoria(budget_df)
 
-            # Formatear la salida
-            styled_ventas = ventas_por_mes.style.format("${:,.2f}").background_gradient(cmap='Blues')
-            st.dataframe(styled_ventas, use_container_width=True)
+            # Crear un DataFrame pivote: MES categórico ordenado deja los meses existentes en orden cronológico
+            ventas_por_mes = ventas_agrupadas.groupby(level=['VDE', 'MES'], observed=True).sum().unstack('MES', fill_value=0)
+            ventas_por_mes.columns = ventas_por_mes.columns.astype(str)  # Arrow no serializa un índice categórico de columnas
+
+            # Formato de moneda en el navegador (column_config) en lugar de un Styler con CSS por celda
+            st.dataframe(
+                ventas_por_mes,
+                column_config={mes: st.column_config.NumberColumn(mes, format="dollar") for mes in ventas_por_mes.columns},
+                use_container_width=True
+            )
 
             # Cumplimiento por Categoría (Versión corregida)
             st.markdown("### 🎯 Cumplimiento por Categoría")
             try:
                 # Primero unimos con los datos de presupuesto si es necesario
                 if 'CATEGORIA' in current_df.columns and 'CATEGORIA' in budget_df.columns:
-                    # Agrupamos ventas por categoría
-                    ventas_categoria = current_df.groupby(['VDE', 'CATEGORIA'])['MONTO'].sum().reset_index()
-                    
-                    # Agrupamos presupuesto por categoría (asumiendo que existe en budget_df)
-                    presupuesto_categoria = budget_df.groupby(['VDE', 'CATEGORIA'])['MONTO'].sum().reset_index()
-                    
-                    # Unimos los datos
-                    cumplimiento_categoria = pd.merge(
-                        ventas_categoria,
-                        presupuesto_categoria,
-                        on=['VDE', 'CATEGORIA'],
-                        how='left',
-                        suffixes=('_Real', '_Presupuesto')
-                    )
-                    
-                    # Calculamos el cumplimiento
-                    cumplimiento_categoria['% Cumplimiento'] = (cumplimiento_categoria['MONTO_Real'] / 
-                                                            cumplimiento_categoria['MONTO_Presupuesto']) * 100
+                    # Ventas contra el presupuesto por categoría (cacheado)
+                    claves = ['VDE', 'CATEGORIA']
+                    cumplimiento_categoria = cumplimiento_por(ventas_agrupadas, metas_por_categoria[tuple(claves)], claves)
                     
                     # Formatear y mostrar
                     st.dataframe(
-                        cumplimiento_categoria.style.format({
-                            'MONTO_Real': '${:,.2f}',
-                            'MONTO_Presupuesto': '${:,.2f}',
-                            '% Cumplimiento': '{:.1f}%'
-                        }).bar(subset=['% Cumplimiento'], align='mid', color=['#d65f5f', '#5fba7d']),
+                        cumplimiento_categoria,
+                        column_config=FORMATO_CUMPLIMIENTO_CATEGORIA,
                         use_container_width=True
                     )
                 else:
@@ -1139,33 +1565,15 @@ def main():
             st.markdown("### 🎯 Cumplimiento por Subcategoría")
             try:
                 if all(col in current_df.columns for col in ['VDE', 'CATEGORIA', 'SUBCATEGORIA']):
-                    # Agrupamos ventas por subcategoría
-                    ventas_subcat = current_df.groupby(['VDE', 'CATEGORIA', 'SUBCATEGORIA'])['MONTO'].sum().reset_index()
-                    
                     if all(col in budget_df.columns for col in ['VDE', 'CATEGORIA', 'SUBCATEGORIA']):
-                        # Agrupamos presupuesto por subcategoría
-                        presupuesto_subcat = budget_df.groupby(['VDE', 'CATEGORIA', 'SUBCATEGORIA'])['MONTO'].sum().reset_index()
-                        
-                        # Unimos los datos
-                        cumplimiento_subcat = pd.merge(
-                            ventas_subcat,
-                            presupuesto_subcat,
-                            on=['VDE', 'CATEGORIA', 'SUBCATEGORIA'],
-                            how='left',
-                            suffixes=('_Real', '_Presupuesto')
-                        )
-                        
-                        # Calculamos el cumplimiento
-                        cumplimiento_subcat['% Cumplimiento'] = (cumplimiento_subcat['MONTO_Real'] / 
-                                                            cumplimiento_subcat['MONTO_Presupuesto']) * 100
+                        # Ventas contra el presupuesto por subcategoría (cacheado)
+                        claves = ['VDE', 'CATEGORIA', 'SUBCATEGORIA']
+                        cumplimiento_subcat = cumplimiento_por(ventas_agrupadas, metas_por_categoria[tuple(claves)], claves)
                         
                         # Formatear y mostrar
                         st.dataframe(
-                            cumplimiento_subcat.style.format({
-                                'MONTO_Real': '${:,.2f}',
-                                'MONTO_Presupuesto': '${:,.2f}',
-                                '% Cumplimiento': '{:.1f}%'
-                            }).bar(subset=['% Cumplimiento'], align='mid', color=['#d65f5f', '#5fba7d']),
+                            cumplimiento_subcat,
+                            column_config=FORMATO_CUMPLIMIENTO_CATEGORIA,
                             use_container_width=True,
                             height=400
                         )
@@ -1182,25 +1590,11 @@ def main():
                 # Verificamos las columnas necesarias
                 required_cols = ['VDE', 'COD_PROD', 'Descripcion', 'MONTO', 'Cantidad']
                 if all(col in current_df.columns for col in required_cols):
-                    # Agrupación correcta usando named aggregation
-                    top_productos = current_df.groupby(['VDE', 'COD_PROD', 'Descripcion']).agg(
-                        Ventas=pd.NamedAgg(column='MONTO', aggfunc='sum'),
-                        Cantidad=pd.NamedAgg(column='Cantidad', aggfunc='sum')
-                    ).reset_index().sort_values('Ventas', ascending=False)
+                    # Top de productos de todos los vendedores en una sola agrupación (cacheada)
+                    top_productos = top_productos_por_vendedor(current_df[required_cols])
                     
-                    # Mostrar top 10 por vendedor
-                    for vendedor in current_df['VDE'].unique():
-                        st.markdown(f"#### Vendedor: {vendedor}")
-                        df_vendedor = top_productos[top_productos['VDE'] == vendedor].head(60)
-                        
-                        # Formatear el dataframe para mostrar
-                        st.dataframe(
-                            df_vendedor[['COD_PROD', 'Descripcion', 'Ventas', 'Cantidad']].style.format({
-                                'Ventas': '${:,.2f}',
-                                'Cantidad': '{:,.0f}'
-                            }),
-                            use_container_width=True
-                        )
+                    # Una sola tabla con selector de vendedor (en lugar de una tabla por vendedor)
+                    mostrar_top_productos(top_productos)
                 else:
                     missing_cols = [col for col in required_cols if col not in current_df.columns]
                     st.warning(f"Faltan columnas necesarias: {', '.join(missing_cols)}")
@@ -1228,7 +1622,7 @@ def main():
             st.header("Filtros de Proyecciones")
 
             # Obtener solo semanas con datos disponibles
-            semanas_con_datos = sorted(sales_df[sales_df['ANO'] == year_filter]['SEM'].unique(), reverse=True)
+            semanas_con_datos = opciones['SEM'].get(year_filter, [])
 
             # Selección de semana - solo muestra semanas con datos
             semana_filter = st.selectbox(
@@ -1238,7 +1632,7 @@ def main():
             )
 
             # Selección de meses - ahora ordenados cronológicamente
-            meses_disponibles = sorted(sales_df['MES'].unique(), key=lambda x: MESES_ORDEN.index(x))
+            meses_disponibles = opciones['MES']
             meses_seleccionados = st.multiselect(
                 "Seleccionar mes(es) para proyección",
                 options=meses_disponibles,
@@ -1246,7 +1640,7 @@ def main():
             )
 
             # Selección de vendedores
-            vendedores_disponibles = sorted(sales_df['VDE'].unique())
+            vendedores_disponibles = opciones['VDE']
             vendedores_seleccionados = st.multiselect(
                 "Seleccionar vendedor(es) para proyección",
                 options=vendedores_disponibles,
@@ -1258,10 +1652,7 @@ def main():
             return
 
         # Filtrar datos por año y vendedores seleccionados
-        current_df = sales_df[
-            (sales_df['ANO'] == year_filter) &
-            (sales_df['VDE'].isin(vendedores_seleccionados))
-        ]
+        current_df = filtrar_ano_vendedores(sales_df, year_filter, vendedores_seleccionados)
 
         if current_df.empty:
             st.warning("No hay datos disponibles con los filtros seleccionados")
@@ -1273,7 +1664,9 @@ def main():
         with col1:
             # Proyección Semanal usando el método de la clase KPICalculator
             st.markdown(f"**📅 Proyección Semanal {semana_filter}**")
-            proyeccion_semanal = kpi_calculator.calcular_proyeccion_semanal(current_df, semana_filter)
+            # Filas de la semana con una sola máscara: la proyección y el gráfico usan el mismo recorte
+            filas_semana = current_df[current_df['SEM'] == semana_filter]
+            proyeccion_semanal = kpi_calculator.calcular_proyeccion_semanal(filas_semana, semana_filter)
 
             if proyeccion_semanal:
                 st.markdown(f"""
@@ -1301,37 +1694,10 @@ def main():
                 """, unsafe_allow_html=True)
 
                 # Gráfico evolutivo semanal
-                ventas_por_dia = current_df[current_df['SEM'] == semana_filter].groupby('DIA_SEM')['MONTO'].sum().reset_index()
-
-                # Ordenar los días de la semana correctamente
-                semana_orden = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-                ventas_por_dia['DIA_SEM'] = pd.Categorical(
-                    ventas_por_dia['DIA_SEM'],
-                    categories=semana_orden,
-                    ordered=True
-                )
-                ventas_por_dia = ventas_por_dia.sort_values('DIA_SEM')
+                # Ventas por día ya agregadas (y cacheadas) junto con la proyección
+                ventas_por_dia = proyeccion_semanal['ventas_por_dia']
 
-                fig_semana = px.line(
-                    ventas_por_dia,
-                    x='DIA_SEM',
-                    y='MONTO',
-                    title=f"Evolución Semana {semana_filter}",
-                    markers=True,
-                    labels={'MONTO': 'Ventas ($)', 'DIA_SEM': 'Día de la semana'}
-                )
-                fig_semana.update_layout(
-                    plot_bgcolor='white',
-                    paper_bgcolor='white',
-                    xaxis=dict(
-                        showgrid=False,
-                        categoryorder='array',
-                        categoryarray=semana_orden
-                    ),
-                    yaxis=dict(showgrid=False),
-                    height=300,
-                    margin=dict(l=40, r=40, t=40, b=40)
-                )
+                fig_semana = grafico_semana(ventas_por_dia, semana_filter)
                 st.plotly_chart(fig_semana, use_container_width=True)
             else:
                 st.warning(f"No hay datos para la semana {semana_filter} con los filtros actuales")
@@ -1342,7 +1708,8 @@ def main():
 
             if meses_seleccionados:
                 mes_actual = meses_seleccionados[0]
-                proyeccion_mensual = kpi_calculator.calcular_proyeccion_mensual(current_df, mes_actual)
+                filas_mes = current_df[current_df['MES'] == mes_actual]  # Mismo recorte para la proyección y el gráfico
+                proyeccion_mensual = kpi_calculator.calcular_proyeccion_mensual(filas_mes, mes_actual)
 
                 if proyeccion_mensual:
                     st.markdown(f"""
@@ -1385,21 +1752,9 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
 
-                    # Gráfico de evolución diaria
-                    ventas_diarias = current_df[current_df['MES'] == mes_actual].groupby('Fecha')['MONTO'].sum().reset_index()
-                    fig = px.line(
-                        ventas_diarias,
-                        x='Fecha',
-                        y='MONTO',
-                        title=f'Evolución de Ventas Diarias - {mes_actual}',
-                        markers=True
-                    )
-                    fig.update_layout(
-                        plot_bgcolor='white',
-                        paper_bgcolor='white',
-                        xaxis=dict(showgrid=False),
-                        yaxis=dict(showgrid=False)
-                    )
+                    # Gráfico de evolución diaria (agregado y cacheado junto con la proyección)
+                    ventas_diarias = proyeccion_mensual['ventas_diarias']
+                    fig = grafico_ventas_diarias(ventas_diarias, mes_actual)
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     st.warning(f"No hay datos para {mes_actual}")